@@ -1,38 +1,115 @@
+import codecs
 import csv
+import io
+from collections import deque
+import math
 import os
+import re
+import sys
 
-def split_csv(input_file, output_prefix, chunk_size=10):
-    with open(input_file, mode='r', encoding='utf-8-sig') as infile:
-        reader = csv.reader(infile)
-        header = next(reader)
+# Whitespace padding around delimiters, e.g. `a , b` -> `a,b`
+_PADDED_DELIMITER = re.compile(rb"[ \t]*,[ \t]*")
+
+# Trimmed from both ends of values in one C-level strip call: every character str.strip()
+# treats as whitespace (incl. NBSP, EM SPACE), plus both quote characters
+_STRIP_CHARS = "".join(c for c in map(chr, range(sys.maxunicode + 1)) if c.isspace()) + "'\""
+
+DEFAULT_CHUNK_SIZE = 50000
+MAX_RECORD_LINES = 50 # a quoted field still open after this many lines is treated as a stray quote
+
+
+def _count_rows(path):
+    # Data lines (minus the header), counted on raw 1 MiB blocks
+    with open(path, mode='rb') as f:
+        return sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b"")) - 1
+
+
+def _open_quoted(record):
+    # True when the record ends inside a quoted field, i.e. it continues on the next line.
+    # Only a quote at the start of a field opens one, so `5"x@y` is not a continuation.
+    try:
+        for _ in csv.reader(io.StringIO(record.decode('utf-8'), newline=''), strict=True):
+            pass
+    except csv.Error as e:
+        return "unexpected end of data" in str(e)
+    return False
+
+
+def _clean_quoted(record):
+    # Slow path for records containing quotes or non-ASCII: let the csv module handle quoted
+    # delimiters / embedded newlines, then clean each value as before
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for row in csv.reader(io.StringIO(record.decode('utf-8'), newline='')):
+        writer.writerow([col.strip(_STRIP_CHARS) for col in row])
+    return out.getvalue().encode('utf-8')
+
+
+def split_csv(input_file, output_prefix, chunk_size=None):
+    if chunk_size is None:
+        # One chunk per CPU for large files, never smaller than the default
+        chunk_size = DEFAULT_CHUNK_SIZE
+        n = _count_rows(input_file)
+        if n > DEFAULT_CHUNK_SIZE:
+            chunk_size = max(DEFAULT_CHUNK_SIZE, math.ceil(n / (os.cpu_count() or 1)) + 1)
+
+    # Records are copied as raw bytes; only lines containing quotes or non-ASCII go through the csv module
+    with open(input_file, mode='rb') as infile:
+        header = infile.readline()
+        if header.startswith(codecs.BOM_UTF8):
+            header = header[len(codecs.BOM_UTF8):]
+        header = header.rstrip(b"\r\n") + b"\r\n"
 
         file_count = 1
         row_count = 0
 
-        outfile = open(f"{output_prefix}_part{file_count}.csv", mode='w', newline='', encoding='utf-8')
-        writer = csv.writer(outfile)
-        writer.writerow(header)
+        outfile = open(f"{output_prefix}_part{file_count}.csv", mode='wb')
+        outfile.write(header)
 
-        for row in reader:
-            # Clean each value in the row
-            cleaned_row = [
-                (col.strip().strip("'").strip('"') if col else "")
-                for col in row
-            ]
+        lines = iter(infile)
+        pending = []  # lines of a record whose quoted field spans lines
+        replay = deque()  # lines to re-read after giving up on an unterminated quote
+        while True:
+            line = replay.popleft() if replay else next(lines, b"")
+            if not line:
+                break
+
+            # Byte fast path only for plain ASCII lines; quotes or non-ASCII (e.g. NBSP padding
+            # from Excel) go through the decoded per-cell cleaning
+            if pending or not line.isascii() or b'"' in line or b"'" in line:
+                pending.append(line)
+                record = b"".join(pending)
+                if _open_quoted(record):
+                    if len(pending) < MAX_RECORD_LINES:
+                        continue
+                    # Never closed: keep the first line as its own record and re-read the rest
+                    replay.extendleft(reversed(pending[1:]))
+                    record = pending[0]
+                record = _clean_quoted(record)
+                pending = []
+            else:
+                record = _PADDED_DELIMITER.sub(b",", line.strip())
+                if record:
+                    record += b"\r\n"
+
+            if not record:
+                continue
 
             if row_count >= chunk_size:
                 outfile.close()
                 file_count += 1
                 row_count = 0
 
-                outfile = open(f"{output_prefix}_part{file_count}.csv", mode='w', newline='', encoding='utf-8')
-                writer = csv.writer(outfile)
-                writer.writerow(header)
+                outfile = open(f"{output_prefix}_part{file_count}.csv", mode='wb')
+                outfile.write(header)
 
-            writer.writerow(cleaned_row)
+            outfile.write(record)
             row_count += 1
 
+        if pending:
+            outfile.write(_clean_quoted(b"".join(pending)))
+
         outfile.close()
         print(f"Finished splitting. Created {file_count} files.")
 
-split_csv("winnerprofile_email.csv", "output/winnerprofiles/chunk/chunk", chunk_size=50000) #change input file name and output prefix according to step1, step2 email/moble identifiers and chunk size
\ No newline at end of file
+split_csv("winnerprofile_email.csv", "output/winnerprofiles/chunk/chunk") #change input file name and output prefix according to step1, step2 email/moble identifiers; pass chunk_size to override the auto size
\ No newline at end of file
@@ -3,12 +3,21 @@
 import os
 import csv
 import json
+import hashlib
 import time
+import random
 import glob
 import logging
-from typing import Optional, Tuple, List
+import queue
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Optional, Tuple, List, Union
 
-import requests
+import orjson
+import httpx
 
 # ---------------------------------------
 # CONFIGURATION
@@ -22,6 +31,7 @@ RESULT_SUMMARY = "results_summary.csv"
 
 IDENTITY_BASE_URL = "https://identity.mparticle.com/v1"
 EVENTS_BASE_URL = "https://s2s.mparticle.com/v2/events"
+BULK_EVENTS_URL = "https://s2s.mparticle.com/v2/bulkevents"
 
 MPARTICLE_API_KEY = os.getenv("MPARTICLE_API_KEY", "") # set STG, PROD Keys here
 MPARTICLE_API_SECRET = os.getenv("MPARTICLE_API_SECRET", "") # set STG,PROD Secret here
@@ -29,9 +39,21 @@ MPARTICLE_API_SECRET = os.getenv("MPARTICLE_API_SECRET", "") # set STG,PROD Secr
 ENVIRONMENT = "production" #change production for production run
 DRY_RUN = False # change it to False for Real time run
 REQUEST_TIMEOUT = 20
-RATE_LIMIT_DELAY = 0.2
+RATE_LIMIT_RPS = 50 # average requests/sec across all workers and processes
+RATE_LIMIT_BURST = 100 # requests that may go out back-to-back after an idle spell
+WORKERS = 16 # concurrent rows in flight per file
+FILE_WORKERS = os.cpu_count() or 1 # chunk files processed in parallel (one process each)
+EVENTS_BATCH_SIZE = 100 # events payloads per bulkevents request
 MAX_RETRIES = 3
 INITIAL_BACKOFF = 1.0
+BACKOFF_CAP = 10.0 # ceiling for a single jittered backoff sleep
+RETRY_BUDGET_S = 30.0 # total wall-clock time one request may spend on retries
+
+EVENTS_QUEUED = "queued" # events_status of a row waiting for the next bulkevents flush
+
+SUMMARY_FIELDS = ["mpid","email","phone","modify_status","events_status","retries","message"]
+SUMMARY_FLUSH_EVERY = 500 # rows between summary file flushes
+PREFETCH_ROWS = 1000 # parsed rows the reader thread may queue ahead of the workers
 
 EMAIL_HEADER = "Email_Address"
 MPID_HEADER = "External_ID"
@@ -65,72 +87,169 @@ def make_auth():
     return None
 
 
-def retryable_post(url: str, auth, json_payload: dict, dry_run=False):
+def make_client():
+    # HTTP/2 multiplexes all worker threads' requests over one TLS connection per host
+    return httpx.Client(
+        http2=True,
+        timeout=REQUEST_TIMEOUT,
+        # Enough connections for every worker plus the events flusher if HTTP/2 falls back to HTTP/1.1
+        limits=httpx.Limits(max_connections=WORKERS + 1, max_keepalive_connections=WORKERS + 1),
+        headers={"Content-Type": "application/json"}  # bodies are pre-serialized with orjson
+    )
+
+
+class TokenBucket:
+    """Allows `rate` requests/sec on average with bursts up to `burst`, shared by all worker threads."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        # Tokens may go negative: each caller reserves its slot under the lock and sleeps outside it
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def backoff_delay(prev: float, resp=None) -> Tuple[float, float]:
+    """Return (delay, new prev): decorrelated jitter capped at BACKOFF_CAP, or the server's Retry-After."""
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, 0.5), prev
+        except ValueError:
+            pass  # HTTP-date form, fall back to jitter
+    prev = min(BACKOFF_CAP, random.uniform(INITIAL_BACKOFF, prev * 3))
+    return prev, prev
+
+
+def idempotency_key(*parts) -> str:
+    """Deterministic key for one logical operation, identical across its retries."""
+    return hashlib.sha1("|".join(str(p or "") for p in parts).encode("utf-8")).hexdigest()
+
+
+def retryable_post(client, url: str, auth, json_payload: Union[dict, list], dry_run=False, limiter=None, idempotency=None):
     if dry_run:
         return None, 0, None
 
-    backoff = INITIAL_BACKOFF
+    prev = INITIAL_BACKOFF
     attempt = 0
+    fixups = 0  # resends of a corrected payload after a 400; these don't use up MAX_RETRIES
     last_err = None
-
-    while attempt < MAX_RETRIES:
+    start = time.monotonic()
+
+    def backoff(resp=None) -> bool:
+        # Sleep before the next attempt; False when there is none left or it would overrun RETRY_BUDGET_S
+        nonlocal prev, last_err
+        if attempt >= MAX_RETRIES + fixups:
+            return False
+        delay, prev = backoff_delay(prev, resp)
+        if time.monotonic() - start + delay > RETRY_BUDGET_S:
+            last_err = f"budget_exhausted: {last_err}"
+            return False
+        time.sleep(delay)
+        return True
+
+    while attempt < MAX_RETRIES + fixups:
         attempt += 1
         try:
-            resp = requests.post(url, auth=auth, json=json_payload, timeout=REQUEST_TIMEOUT)
+            if limiter is not None:
+                limiter.take()
+            # Serialized per attempt: the 400 handler below may have changed the payload
+            resp = client.post(url, auth=auth, content=orjson.dumps(json_payload),
+                               headers={"Idempotency-Key": idempotency} if idempotency else None)
             if resp.status_code >= 200 and resp.status_code < 300:
                 return resp, attempt, None
-            elif resp.status_code == 400:
-                if(resp.json().get("Errors", [{}])[0].get("message") == "MpId doesn't exist"):
+            elif resp.status_code == 400 and isinstance(json_payload, dict):
+                # Fix-ups apply to single-profile payloads only, not bulkevents lists
+                try:
+                    body = orjson.loads(resp.content)
+                except orjson.JSONDecodeError:
+                    body = {}
+                err = body.get("Errors", [{}])[0].get("message", "") if isinstance(body, dict) else ""
+                # A fixed-up payload is a different operation, so it gets its own (still deterministic) key
+                if err == "MpId doesn't exist" and json_payload.get("environment") != "development":
                     json_payload["environment"] = "development"
-                    resp, attempt, last_err = retryable_post(url, auth, json_payload, dry_run)
-                elif(resp.json().get("Errors", [{}])[0].get("message") == "ToModifyIdentities is empty."):
-                   for ident in json_payload["identity_changes"]:
-                    if ident["identity_type"] == "mobile_number":
-                        ident["old_value"] = None
-                    resp, attempt, last_err = retryable_post(url, auth, json_payload, dry_run)
-               
+                    idempotency = idempotency and idempotency_key(idempotency, err)
+                    last_err = f"Status 400: {err}"
+                    fixups += 1
+                    continue
+                elif err == "ToModifyIdentities is empty.":
+                    changed = False
+                    for ident in json_payload.get("identity_changes", []):
+                        if ident["identity_type"] == "mobile_number" and ident["old_value"] is not None:
+                            ident["old_value"] = None
+                            changed = True
+                    if changed:
+                        idempotency = idempotency and idempotency_key(idempotency, err)
+                        last_err = f"Status 400: {err}"
+                        fixups += 1
+                        continue
 
             last_err = f"Status {resp.status_code}: {resp.text}"
 
             if resp.status_code >= 500 or resp.status_code == 429:
-                time.sleep(backoff)
-                backoff *= 2
-                continue
+                if backoff(resp):
+                    continue
+                break
 
             return resp, attempt, last_err
 
-        except requests.exceptions.RequestException as e:
+        except httpx.RequestError as e:
             last_err = str(e)
-            time.sleep(backoff)
-            backoff *= 2
+            if not backoff():
+                break
 
     return None, attempt, last_err
 
+# Static payload parts, built once. Nested objects in _EVENTS_TEMPLATE are shared
+# between payloads and must not be mutated; per-row fields are set on the copy.
+_EMAIL_CHANGE = {"old_value": None, "new_value": None, "identity_type": "email"}
+_MOBILE_CHANGE = {"old_value": None, "new_value": None, "identity_type": "mobile_number"}
+
+_EVENT_DATA_TEMPLATE = {
+    "event_name": "ProfileToKeep",
+    "custom_event_type": "other",
+    "user_attribute_name": "ProfileToKeep",
+    "new": "false",
+    "is_new_attribute": "false"
+}
+
+_EVENTS_TEMPLATE = {
+    "mpid": None,
+    "schema_version": 2,
+    "environment": ENVIRONMENT,
+    "events": [],
+    "user_attributes": {
+        "ProfileToKeep": "false",
+        "$mobile": None
+    },
+    "user_identities": {
+        "email": None,
+        "mobile_number": None
+    }
+}
+
+
 def build_modify_payload(email, phone, environment):
     # Normalize blanks → None
     email = email.strip() if email and email.strip() != "" else None
     phone = phone.strip() if phone and phone.strip() != "" else None
     changes = []
-    if email is None and phone is None:
-        return {
-            "environment": environment,
-            "identity_changes": []
-        }
-    # Add email only if not None
+    # Identity changes are copied per row: retryable_post may rewrite old_value on a 400
     if email is not None:
-        changes.append({
-            "old_value": email,
-            "new_value": None,
-            "identity_type": "email"
-        })
-
-    # Add phone only if not None
+        changes.append({**_EMAIL_CHANGE, "old_value": email})
     if phone is not None:
-        changes.append({
-            "old_value": phone,
-            "new_value": None,
-            "identity_type": "mobile_number"
-        })
+        changes.append({**_MOBILE_CHANGE, "old_value": phone})
 
     return {
         "environment": environment,
@@ -139,37 +258,168 @@ def build_modify_payload(email, phone, environment):
 
 
 def build_events_payload(mpid):
+    # source_message_id is stable per MPID, so mParticle drops the event if a retried batch is delivered twice
+    data = {**_EVENT_DATA_TEMPLATE, "source_message_id": idempotency_key(mpid, "events")}
+    return {**_EVENTS_TEMPLATE, "mpid": mpid, "events": [{"event_type": "custom_event", "data": data}]}
+
+
+# ---------------------------------------
+# Process single row (runs in a worker thread)
+# ---------------------------------------
+def handle_row(row_num: int, mpid: Optional[str], email: Optional[str], phone: Optional[str],
+               client, auth, limiter, logger, dry_run=True) -> dict:
+    if not mpid:
+        msg = "SKIPPED: Missing MPID"
+        logger.warning(f"Row {row_num}: {msg}")
+        return {
+            "mpid": "",
+            "email": email or "",
+            "phone": phone or "",
+            "modify_status": "skipped",
+            "events_status": "skipped",
+            "retries": 0,
+            "message": msg
+        }
+
+    if not email and not phone:
+        # Nothing to remove from this profile: the Modify call would be an empty identity_changes 400
+        msg = "SKIPPED: No email or phone"
+        logger.warning(f"Row {row_num}: {msg}")
+        return {
+            "mpid": mpid,
+            "email": "",
+            "phone": "",
+            "modify_status": "skipped_empty",
+            "events_status": "skipped",
+            "retries": 0,
+            "message": msg
+        }
+
+    logger.info(f"Row {row_num} → MPID={mpid}, email={email}, phone={phone}")
+
+    # ---------------------------
+    # Step 1 — Modify API
+    # ---------------------------
+    modify_url = f"{IDENTITY_BASE_URL}/{mpid}/modify"
+    modify_payload = build_modify_payload(email, phone, ENVIRONMENT)
+
+    if dry_run:
+        logger.info(f"[DRY-RUN] Modify → {modify_payload}")
+        modify_status = "dry-run"
+        modify_attempts = 0
+        modify_err = None
+    else:
+        resp, attempts, err = retryable_post(
+            client, modify_url, auth, modify_payload, limiter=limiter,
+            idempotency=idempotency_key(mpid, email, phone, "modify")
+        )
+        modify_attempts = attempts
+        modify_err = err
+
+        if resp is not None:
+            modify_status = str(resp.status_code)
+        else:
+            modify_status = "failed"
+
+    # ---------------------------
+    # Step 2 — Events API (only if Modify succeeded); sent in bulk by flush_events
+    # ---------------------------
+    if dry_run:
+        logger.info(f"[DRY-RUN] Events → MPID={mpid}")
+        events_status = "dry-run"
+    elif str(modify_status).startswith("2"):  # modify success
+        events_status = EVENTS_QUEUED
+    else:
+        events_status = "skipped_modify_failed"
+
     return {
         "mpid": mpid,
-        "schema_version": 2,
-        "environment": ENVIRONMENT,
-        "events": [
-            {
-                "event_type": "custom_event",
-                "data": {
-                    "event_name": "ProfileToKeep",
-                    "custom_event_type": "other",
-                    "user_attribute_name": "ProfileToKeep",
-                    "new": "false",
-                    "is_new_attribute": "false"
-                }
-            }
-        ],
-        "user_attributes": {
-            "ProfileToKeep": "false",
-            "$mobile": None
-        },
-        "user_identities": {
-            "email": None,
-            "mobile_number": None
-        }
+        "email": email or "",
+        "phone": phone or "",
+        "modify_status": modify_status,
+        "events_status": events_status,
+        "retries": modify_attempts,
+        "message": (modify_err or "")
     }
 
 
 # ---------------------------------------
-# Process single file SEQUENTIALLY
+# Events flush (runs on the single flusher thread)
+# ---------------------------------------
+def send_events(rows: List[dict], client, auth, limiter, logger):
+    """Post the events for `rows` and record each row's events status, attempts and error."""
+    if len(rows) == 1:
+        # Single row on /v2/events: retryable_post retries a missing MPID in development like the per-row call did
+        mpid = rows[0]["mpid"]
+        resp, attempts, err = retryable_post(
+            client, EVENTS_BASE_URL, auth, build_events_payload(mpid), limiter=limiter,
+            idempotency=idempotency_key(mpid, "events")
+        )
+    else:
+        resp, attempts, err = retryable_post(
+            client, BULK_EVENTS_URL, auth, [build_events_payload(r["mpid"]) for r in rows], limiter=limiter,
+            idempotency=idempotency_key(*(r["mpid"] for r in rows), "events")
+        )
+        if resp is not None and resp.status_code == 400:
+            # One bad row (e.g. "MpId doesn't exist") rejects the whole batch: split it in halves
+            # so each bad MPID costs O(log n) extra requests, not one per row
+            logger.warning(f"Bulk events → 400 for {len(rows)} MPIDs, splitting batch: {err}")
+            for r in rows:
+                r["retries"] += attempts
+            mid = len(rows) // 2
+            send_events(rows[:mid], client, auth, limiter, logger)
+            send_events(rows[mid:], client, auth, limiter, logger)
+            return
+
+    events_status = str(resp.status_code) if resp is not None else "failed"
+    logger.info(f"Events → {len(rows)} MPIDs, status={events_status}")
+    for r in rows:
+        r["events_status"] = events_status
+        r["retries"] += attempts
+        r["message"] = r["message"] or err or ""
+
+
+def flush_events(results: List[dict], client, auth, limiter, logger) -> List[dict]:
+    queued = [r for r in results if r["events_status"] == EVENTS_QUEUED]
+    if queued:
+        send_events(queued, client, auth, limiter, logger)
+    return results
+
+
+# ---------------------------------------
+# Reader thread (parses the chunk file ahead of the workers)
+# Queues (row_num, mpid, email, phone) tuples, blanks as None
+# ---------------------------------------
+def read_rows(file_path: str, q: queue.Queue, errors: list):
+    try:
+        with open(file_path, newline="",encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            # Column positions resolved once; a missing column points past the header and reads as blank
+            i_mpid, i_email, i_phone = (
+                header.index(h) if h in header else len(header)
+                for h in (MPID_HEADER, EMAIL_HEADER, PHONE_HEADER)
+            )
+            width = max(i_mpid, i_email, i_phone) + 1
+
+            row_num = 0
+            for row in reader:
+                if not row:
+                    continue  # blank line
+                row_num += 1
+                if len(row) < width:
+                    row += [""] * (width - len(row))
+                q.put((row_num, row[i_mpid].strip() or None, row[i_email].strip() or None, row[i_phone].strip() or None))
+    except Exception as e:
+        errors.append(e)
+    finally:
+        q.put(None)  # sentinel: no more rows
+
+
+# ---------------------------------------
+# Process single file (rows in parallel threads)
 # ---------------------------------------
-def process_file(file_path: str, dry_run=True, rate_limit=RATE_LIMIT_DELAY) -> str:
+def process_file(file_path: str, dry_run=True, rate_limit=RATE_LIMIT_RPS, burst=RATE_LIMIT_BURST) -> str:
     filename = os.path.basename(file_path)
     filestem = os.path.splitext(filename)[0]
 
@@ -183,101 +433,76 @@ def process_file(file_path: str, dry_run=True, rate_limit=RATE_LIMIT_DELAY) -> s
         fh2.setFormatter(fmt)
         logger.addHandler(fh2)
 
-    logger.info(f"START file: {file_path}, dry_run={dry_run}")
+    master_log.info(f"Processing: {file_path}")
+    logger.info(f"START file: {file_path}, dry_run={dry_run}, workers={WORKERS}")
 
     auth = make_auth()
-    results = []
-
-    with open(file_path, newline="",encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f)
-        row_num = 0
-
-        for row in reader:
-            row_num += 1
-            email = row.get(EMAIL_HEADER, "").strip() or None
-            mpid = row.get(MPID_HEADER, "").strip() or None
-            phone = row.get(PHONE_HEADER, "").strip() or None
-
-            if not mpid:
-                msg = "SKIPPED: Missing MPID"
-                logger.warning(f"Row {row_num}: {msg}")
-                results.append({
-                    "mpid": "",
-                    "email": email or "",
-                    "phone": phone or "",
-                    "modify_status": "skipped",
-                    "events_status": "skipped",
-                    "retries": 0,
-                    "message": msg
-                })
-                continue
-
-            logger.info(f"Row {row_num} → MPID={mpid}, email={email}, phone={phone}")
-
-            # ---------------------------
-            # Step 1 — Modify API
-            # ---------------------------
-            modify_url = f"{IDENTITY_BASE_URL}/{mpid}/modify"
-            modify_payload = build_modify_payload(email, phone, ENVIRONMENT)
-
-            if dry_run:
-                logger.info(f"[DRY-RUN] Modify → {modify_payload}")
-                modify_status = "dry-run"
-                modify_attempts = 0
-                modify_err = None
-            else:
-                resp, attempts, err = retryable_post(modify_url, auth, modify_payload)
-                modify_attempts = attempts
-                modify_err = err
-
-                if resp is not None:
-                    modify_status = str(resp.status_code)
-                else:
-                    modify_status = "failed"
-
-            # ---------------------------
-            # Step 2 — Events API (only if Modify succeeded)
-            # ---------------------------
-            events_status = ""
-            events_attempts = 0
-            events_err = None
-
-            if dry_run:
-                logger.info(f"[DRY-RUN] Events → MPID={mpid}")
-                events_status = "dry-run"
-            else:
-                if str(modify_status).startswith("2"):  # modify success
-                    events_payload = build_events_payload(mpid)
-                    resp2, attempts2, err2 = retryable_post(EVENTS_BASE_URL, auth, events_payload)
-                    events_attempts = attempts2
-                    events_err = err2
-
-                    if resp2 is not None:
-                        events_status = str(resp2.status_code)
-                    else:
-                        events_status = "failed"
-                else:
-                    events_status = "skipped_modify_failed"
-
-            # Collect results
-            results.append({
-                "mpid": mpid,
-                "email": email or "",
-                "phone": phone or "",
-                "modify_status": modify_status,
-                "events_status": events_status,
-                "retries": modify_attempts + events_attempts,
-                "message": (modify_err or events_err or "")
-            })
-
-            time.sleep(rate_limit)
-
-    # Write per-file summary
-    with open(summary_path, "w", newline="", encoding="utf-8") as sf:
-        writer = csv.DictWriter(sf, fieldnames=["mpid","email","phone","modify_status","events_status","retries","message"])
+    limiter = TokenBucket(rate_limit, burst)
+
+    # Disk read + CSV parse overlaps the API calls; the bounded queue keeps the reader at most PREFETCH_ROWS ahead
+    rows = queue.Queue(maxsize=PREFETCH_ROWS)
+    read_errors = []
+    reader = threading.Thread(target=read_rows, args=(file_path, rows, read_errors), daemon=True)
+    reader.start()
+
+    # Summary rows are written (in input order) as they complete instead of being collected, so partial results survive a crash.
+    # Rows whose events are queued are held back until their bulkevents flush has a status.
+    sf = open(summary_path, "w", newline="", encoding="utf-8")
+    try:
+        writer = csv.DictWriter(sf, fieldnames=SUMMARY_FIELDS)
         writer.writeheader()
-        for r in results:
-            writer.writerow(r)
+        written = 0
+
+        def write_results(results):
+            nonlocal written
+            for r in results:
+                writer.writerow(r)
+                written += 1
+                if written % SUMMARY_FLUSH_EVERY == 0:
+                    sf.flush()
+
+        with make_client() as client, \
+                ThreadPoolExecutor(max_workers=WORKERS) as ex, \
+                ThreadPoolExecutor(max_workers=1) as flusher:
+            pending = deque()  # Modify calls in flight
+            held = []  # finished rows waiting on the next events flush
+            queued = 0
+            flushes = deque()
+
+            def take(fut):
+                nonlocal queued
+                r = fut.result()
+                held.append(r)
+                if r["events_status"] == EVENTS_QUEUED:
+                    queued += 1
+                # Flush on a full events batch, or (dry-run / skipped rows) once enough rows are held
+                if queued >= EVENTS_BATCH_SIZE or len(held) >= SUMMARY_FLUSH_EVERY:
+                    flush()
+
+            def flush():
+                nonlocal held, queued
+                if held:
+                    flushes.append(flusher.submit(flush_events, held, client, auth, limiter, logger))
+                    held, queued = [], 0
+                # Write completed flushes in order; don't let the flusher fall more than 2 batches behind
+                while flushes and (len(flushes) > 2 or flushes[0].done()):
+                    write_results(flushes.popleft().result())
+
+            while (item := rows.get()) is not None:
+                pending.append(ex.submit(handle_row, *item, client, auth, limiter, logger, dry_run))
+                while pending and (len(pending) >= WORKERS * 4 or pending[0].done()):
+                    take(pending.popleft())
+            while pending:
+                take(pending.popleft())
+            flush()
+            while flushes:
+                write_results(flushes.popleft().result())
+    finally:
+        sf.close()
+
+    reader.join()
+    if read_errors:
+        raise read_errors[0]
 
     logger.info(f"END file: {file_path}")
     return summary_path
@@ -287,34 +512,31 @@ def process_file(file_path: str, dry_run=True, rate_limit=RATE_LIMIT_DELAY) -> s
 # Combine summaries
 # ---------------------------------------
 def combine_summaries(files: List[str]):
-    combined = []
-    for f in files:
-        with open(f, newline="", encoding="utf-8") as sf:
-            reader = csv.DictReader(sf)
-            combined.extend(reader)
-
-    if not combined:
+    # All summaries share one header: keep the first, then copy each file's body bytes as-is
+    if not files:
         master_log.info("No summary rows to combine.")
         return
 
-    with open(RESULT_SUMMARY, "w", newline="", encoding="utf-8") as out:
-        writer = csv.DictWriter(out, fieldnames=combined[0].keys())
-        writer.writeheader()
-        for r in combined:
-            writer.writerow(r)
+    with open(RESULT_SUMMARY, "wb") as out:
+        for n, f in enumerate(files):
+            with open(f, "rb") as sf:
+                header = sf.readline()
+                if n == 0:
+                    out.write(header)
+                shutil.copyfileobj(sf, out, 1 << 20)
 
     master_log.info(f"Final summary written to {RESULT_SUMMARY}")
 
 
 # ---------------------------------------
-# MAIN (sequential)
+# MAIN (files in parallel processes, rows in parallel threads)
 # ---------------------------------------
 def main():
   
     dry_run = DRY_RUN
-    rate_limit = RATE_LIMIT_DELAY
+    rate_limit = RATE_LIMIT_RPS
 
-    master_log.info("=== START STEP1 For EMAIL/Mobile IDENTIFIER  CHILD PROFILES RUN (NO PARALLEL) ===")
+    master_log.info("=== START STEP1 For EMAIL/Mobile IDENTIFIER  CHILD PROFILES RUN (PARALLEL) ===")
     master_log.info(f"Chunks dir: {CHUNKS_DIR}")
     master_log.info(f"dry_run={dry_run}")
 
@@ -323,12 +545,16 @@ def main():
         master_log.error(f"No files found in {CHUNKS_DIR}")
         return
 
-    summary_files = []
+    # Each process runs its own token bucket, so split the rate and burst to keep the combined QPS unchanged
+    file_workers = min(len(files), FILE_WORKERS)
+    master_log.info(f"Processing {len(files)} files with {file_workers} processes")
 
-    for f in files:
-        master_log.info(f"Processing: {f}")
-        summary_path = process_file(f, dry_run=dry_run, rate_limit=rate_limit)
-        summary_files.append(summary_path)
+    with ProcessPoolExecutor(max_workers=file_workers) as ex:
+        summary_files = list(ex.map(
+            partial(process_file, dry_run=dry_run,
+                    rate_limit=rate_limit / file_workers, burst=RATE_LIMIT_BURST / file_workers),
+            files
+        ))
 
     combine_summaries(summary_files)
     master_log.info("=== STEP1 For EMAIL/Mobile IDENTIFIER  CHILD PROFILES RUN COMPLETE ===")
@@ -1,7 +1,12 @@
 import csv
 import json
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import time
+import random
 import logging
 import os
 from glob import glob
@@ -23,35 +28,71 @@ PHONE_HEADER = "Phone_Number"
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-
-def read_csv(input_file):
-    with open(input_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        return [row for row in reader]
+# One keep-alive session for every batch so the TCP/TLS connection is reused
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=8))
+SESSION.auth = (MPARTICLE_API_KEY, MPARTICLE_API_SECRET)
+SESSION.headers.update({"Content-Type": "application/json"})
 
 
-def chunkify(data, size):
-    for i in range(0, len(data), size):
-        yield data[i:i + size]
+def skip_invalid_row(input_file):
+    def handler(row):
+        logging.warning(
+            f"Skipping malformed row in {input_file} (line {row.number}): "
+            f"expected {row.expected_columns} columns, got {row.actual_columns}: {row.text!r}"
+        )
+        return "skip"
+    return handler
 
 
-def write_log(log_data):
-    file_exists = os.path.isfile(LOG_FILE)
-    with open(LOG_FILE, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(["mpid", "mobile", "Status Code", "Response"])
-        writer.writerows(log_data)
+def read_csv(input_file):
+    # Only the columns we send, all read as strings so IDs/numbers keep their exact text
+    columns = [MPID_HEADER, PHONE_HEADER]
+    return pacsv.read_csv(
+        input_file,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20),
+        # Quoted values may span lines (chunkify keeps them); a malformed row is logged and dropped, not the whole file
+        parse_options=pacsv.ParseOptions(newlines_in_values=True, invalid_row_handler=skip_invalid_row(input_file)),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=columns,
+            column_types={c: pa.string() for c in columns}
+        )
+    )
+
+
+def open_log():
+    # Opened once per run; the header is only written to a new/empty log
+    f = open(LOG_FILE, 'a', newline='', encoding='utf-8')
+    writer = csv.writer(f)
+    if f.tell() == 0:
+        writer.writerow(["mpid", "mobile", "Status Code", "Response"])
+    return f, writer
+
+
+def backoff_sleep(prev, base, cap=30.0, response=None):
+    # Decorrelated jitter; a Retry-After header from the server takes precedence
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            time.sleep(float(retry_after) + random.uniform(0, 0.5))
+            return prev
+        except ValueError:
+            pass
+    prev = min(cap, random.uniform(base, prev * 3))
+    time.sleep(prev)
+    return prev
 
 
 def send_batch(batch, retries=3, backoff=1):
     events_payload = []
-    log_rows = []
 
-    for row in batch:
-        mpid = row.get(MPID_HEADER)
-        email = row.get(EMAIL_HEADER)
+    # Rows missing the MPID or mobile are logged as skipped and left out of the request
+    log_rows = [[mpid, phone, "Skipped", "Missing MPID or mobile"] for mpid, phone in batch if not mpid or not phone]
+    batch = [(mpid, phone) for mpid, phone in batch if mpid and phone]
+    if not batch:
+        return log_rows
 
+    for mpid, phone in batch:
         user_event = {
             "events": [
                 {
@@ -80,36 +121,33 @@ def send_batch(batch, retries=3, backoff=1):
 
     if DRY_RUN:
         logging.info(f"[DRY RUN] Would send batch of {len(events_payload)} events.")
-        for row in batch:
-            log_rows.append([row.get(MPID_HEADER), row.get(EMAIL_HEADER), "DRY_RUN", "Simulated"])
+        for mpid, phone in batch:
+            log_rows.append([mpid, phone, "DRY_RUN", "Simulated"])
         return log_rows
 
-    headers = {
-        "Content-Type": "application/json"
-    }
-
+    body = orjson.dumps(events_payload)
+    prev = backoff
     for attempt in range(retries):
         try:
-            response = requests.post(
-                BULK_API_URL,
-                headers=headers,
-                auth=(MPARTICLE_API_KEY, MPARTICLE_API_SECRET),
-                json=events_payload
-            )
+            response = SESSION.post(BULK_API_URL, data=body)
             status = response.status_code
             success = status == 202
-            for row in batch:
-                log_rows.append([row.get(MPID_HEADER), row.get(EMAIL_HEADER), status, "Success" if success else response.text])
+            if (status == 429 or status >= 500) and attempt < retries - 1:
+                logging.warning(f"Attempt {attempt + 1} got status {status}, retrying")
+                prev = backoff_sleep(prev, backoff, response=response)
+                continue
+            for mpid, phone in batch:
+                log_rows.append([mpid, phone, status, "Success" if success else response.text])
             logging.info(f"Batch sent: {len(batch)} users, Status: {status}")
             return log_rows
         except requests.exceptions.RequestException as e:
             logging.warning(f"Attempt {attempt + 1} failed: {str(e)}")
             if attempt < retries - 1:
-                time.sleep(backoff * (2 ** attempt))
+                prev = backoff_sleep(prev, backoff)
             else:
                 logging.error(f"Batch failed permanently after {retries} attempts: {str(e)}")
-                for row in batch:
-                    log_rows.append([row.get(MPID_HEADER), row.get(EMAIL_HEADER), "Error", str(e)])
+                for mpid, phone in batch:
+                    log_rows.append([mpid, phone, "Error", str(e)])
                 return log_rows
 
 
@@ -117,17 +155,26 @@ def main():
     chunk_files = sorted(glob(os.path.join(INPUT_DIR, "*.csv")))
     logging.info(f"Found {len(chunk_files)} chunk files to process.")
 
-    for file_path in chunk_files:
-        logging.info(f"Processing file: {file_path}")
-        try:
-            all_data = read_csv(file_path)
-            logging.info(f"  Records found: {len(all_data)}")
-            for batch in chunkify(all_data, BATCH_SIZE):
-                logs = send_batch(batch)
-                write_log(logs)
-                time.sleep(0.5)
-        except Exception as e:
-            logging.error(f"Failed to process file {file_path}: {str(e)}")
+    log_file, log_writer = open_log()
+    try:
+        for file_path in chunk_files:
+            logging.info(f"Processing file: {file_path}")
+            try:
+                table = read_csv(file_path)
+                logging.info(f"  Records found: {table.num_rows}")
+                for record_batch in table.to_batches(max_chunksize=BATCH_SIZE):
+                    batch = list(zip(
+                        record_batch.column(MPID_HEADER).to_pylist(),
+                        record_batch.column(PHONE_HEADER).to_pylist()
+                    ))
+                    logs = send_batch(batch)
+                    log_writer.writerows(logs)
+                    log_file.flush()
+                    time.sleep(0.5)
+            except Exception as e:
+                logging.error(f"Failed to process file {file_path}: {str(e)}")
+    finally:
+        log_file.close()
 
 
 if __name__ == "__main__":